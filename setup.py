@@ -4,7 +4,8 @@ requirements = [
     "pythainlp>=3.1.0",
     "spacy>=3.0",
     "gensim>=4.0",
-    "python-crfsuite"
+    "python-crfsuite",
+    "numpy"
 ]
 
 with open("README.md", "r") as f:
@@ -24,6 +25,9 @@ setup(
     python_requires=">=3.7",
     include_package_data=True,
     install_requires=requirements,
+    extras_require={
+        "nlpo3": ["nlpo3"],
+    },
     license="Apache Software License 2.0",
     zip_safe=False,
     keywords=[
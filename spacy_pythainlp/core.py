@@ -1,18 +1,161 @@
-from pythainlp.tag import pos_tag
+import re
+import sys
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from importlib.util import find_spec
+from itertools import chain
+from multiprocessing import current_process
+from operator import itemgetter
+
+import numpy as np
+
+from pythainlp.tag import NER, pos_tag_sents
+
+try:
+    from pythainlp.parse import dependency_parsing
+except ImportError:
+    # pythainlp.parse is missing from older or trimmed PyThaiNLP installs
+    dependency_parsing = None
 
 from pythainlp.tokenize import (
+    Tokenizer,
+    sent_tokenize,
     word_tokenize,
     DEFAULT_SENT_TOKENIZE_ENGINE,
     DEFAULT_WORD_TOKENIZE_ENGINE
 )
 from spacy import Language, util
+from spacy.attrs import IDX, LENGTH, POS, SENT_START, SPACY
+from spacy.parts_of_speech import IDS as POS_IDS
 from spacy.tokens import Doc, Span
+from spacy.vectors import Vectors
 
 
 DEFAULT_SENT_ENGINE = DEFAULT_SENT_TOKENIZE_ENGINE
 DEFAULT_POS_ENGINE = "perceptron"
 DEFAULT_NER_ENGINE = "thainer"
 
+# nlpo3 is the Rust implementation of newmm, used for newmm when installed
+_HAS_NLPO3 = find_spec("nlpo3") is not None
+
+# Engines that segment with the dictionary trie pythainlp.tokenize.Tokenizer
+# keeps loaded
+_TRIE_ENGINES = frozenset(["newmm", "mm", "longest"])
+
+# An entity is a B- tag followed by any number of I- tags
+_ENTITY_PATTERN = re.compile(r"BI*")
+
+
+@lru_cache(maxsize=8)
+def _get_ner(engine):
+    return NER(engine=engine)
+
+
+def _in_spacy_pipe_worker():
+    """
+    Whether this process is a worker started by nlp.pipe(n_process>1)
+    """
+    # spaCy starts its workers with spacy.language._apply_pipes as target,
+    # other worker processes (multiprocessing.Pool, Celery, ...) don't
+    _target = getattr(current_process(), "_target", None)
+    return (
+        getattr(_target, "__module__", None) == "spacy.language"
+        and getattr(_target, "__name__", None) == "_apply_pipes"
+    )
+
+
+def _is_int(value):
+    try:
+        int(value)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+@lru_cache(maxsize=None)
+def _ner_label(tag):
+    """
+    Get the interned entity label of a B- tag
+    """
+    return sys.intern(tag[2:])
+
+
+@lru_cache(maxsize=8)
+def _get_word_tokenizer(engine):
+    """
+    Get a word tokenize function that keeps its dictionary loaded
+    """
+    if engine == "newmm" and _HAS_NLPO3:
+        engine = "nlpo3"
+    if engine == "nlpo3":
+        if not _HAS_NLPO3:
+            raise ImportError(
+                "tokenize_engine nlpo3 needs the nlpo3 package, "
+                "install it with: pip install spacy-pythainlp[nlpo3]"
+            )
+        return partial(word_tokenize, engine=engine)
+    if engine in _TRIE_ENGINES:
+        return Tokenizer(engine=engine).word_tokenize
+    # Tokenizer passes its default dictionary trie as custom_dict, other
+    # engines (deepcut) would then rebuild and use it on every call
+    return partial(word_tokenize, engine=engine)
+
+
+class _WordVectors:
+    """
+    Load a word vector model into a vocab, and the Doc, Span and Token
+    vector hooks that do so on first use
+
+    Only the model name is kept, the hooks take the vocab from what they
+    are called on, so a Doc carrying them pickles without the pipeline.
+    """
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    def load(self, vocab):
+        if vocab.vectors.name != self.model_name:
+            from pythainlp.word_vector import WordVector
+            _wv = WordVector(model_name=self.model_name)
+            # Hand the whole KeyedVectors matrix to spaCy in one go, row i
+            # of the matrix belongs to index_to_key[i]. The WordVector is
+            # not kept, so the vocab holds the only copy of the matrix.
+            vocab.vectors = Vectors(
+                data=np.asarray(_wv.model.vectors, dtype="float32"),
+                # Register every word and get its hash in one sweep, so
+                # Vectors gets int keys and doesn't hash the strings again
+                keys=list(map(vocab.strings.add, _wv.model.index_to_key)),
+                name=self.model_name,
+            )
+        return vocab
+
+    def token_vector(self, token):
+        return self.load(token.vocab).get_vector(token.orth)
+
+    def token_has_vector(self, token):
+        return self.load(token.vocab).has_vector(token.orth)
+
+    def mean_vector(self, tokens):
+        vocab = self.load(tokens.vocab)
+        if not len(tokens):
+            return np.zeros((vocab.vectors_length,), dtype="float32")
+        return np.mean([vocab.get_vector(i.orth) for i in tokens], axis=0)
+
+    def any_has_vector(self, tokens):
+        vocab = self.load(tokens.vocab)
+        return any(vocab.has_vector(i.orth) for i in tokens)
+
+    def similarity(self, obj, other):
+        # Load first, spaCy's own similarity warns when no vectors are loaded
+        self.load(obj.vocab)
+        vector = obj.vector
+        other_vector = other.vector
+        norm = np.linalg.norm(vector) * np.linalg.norm(other_vector)
+        if norm == 0:
+            return 0.0
+        return float(np.dot(vector, other_vector) / norm)
+
 
 @Language.factory(
     "pythainlp",
@@ -31,7 +174,8 @@ DEFAULT_NER_ENGINE = "thainer"
         "dependency_parsing_engine": "esupar",
         "dependency_parsing_model": None,
         "word_vector": True,
-        "word_vector_model": "thai2fit_wv"
+        "word_vector_model": "thai2fit_wv",
+        "word_vector_lazy": False
     },
 )
 class PyThaiNLP:
@@ -56,7 +200,8 @@ class PyThaiNLP:
         word_vector,
         dependency_parsing_model,
         word_vector_model,
-        pos_corpus
+        pos_corpus,
+        word_vector_lazy
     ):
         """
         Initialize
@@ -64,8 +209,8 @@ class PyThaiNLP:
         self.nlp = nlp
         self.word_vector = word_vector
         self.word_vector_model = word_vector_model
-        if self.word_vector:
-            self._vec()
+        self.word_vector_lazy = word_vector_lazy
+        self._vectors = _WordVectors(word_vector_model)
         self.pos_engine = pos_engine
         self.sent_engine = sent_engine
         self.ner_engine = ner_engine
@@ -78,152 +223,322 @@ class PyThaiNLP:
         self.dependency_parsing = dependency_parsing
         self.dependency_parsing_engine = dependency_parsing_engine
         self.dependency_parsing_model = dependency_parsing_model
-        if self.on_ner:
-            from pythainlp.tag import NER
-            self.ner = NER(engine=self.ner_engine)
-
-    def __call__(self, doc:Doc):
+        # Word vectors and the NER model are loaded from disk independently
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            _vec_loading = (
+                executor.submit(self._vectors.load, self.nlp.vocab)
+                if self.word_vector and not self.word_vector_lazy
+                else None
+            )
+            if self.on_ner:
+                self.ner = executor.submit(_get_ner, self.ner_engine).result()
+            if _vec_loading is not None:
+                _vec_loading.result()
+        # Dependency parsing brings its own word and sentence segmentation
         if self.dependency_parsing:
-            doc = self._dep(doc)
+            if dependency_parsing is None:
+                raise ImportError(
+                    "dependency_parsing needs pythainlp.parse, "
+                    "upgrade PyThaiNLP: pip install -U pythainlp"
+                )
             self.on_tokenize = False
             self.on_sent = False
+        # Engine objects are built once here and reused for every Doc
         if self.on_tokenize:
-            doc = self._tokenize(doc)
-        if self.on_sent:
-            doc = self._sent(doc)
+            self._word_tokenize = _get_word_tokenizer(self.tokenize_engine)
         if self.on_pos:
-            doc = self._pos(doc)
-        if self.on_ner:
-            doc = self._ner(doc)
+            self._pos_tag_sents = partial(
+                pos_tag_sents, engine=self.pos_engine, corpus=self.pos_corpus
+            )
+        # thainer computes perceptron POS tags as NER features, when they
+        # come from the same corpus _pos uses one NER pass can set both.
+        # Ask the tagger itself: thainer 1.5 (PyThaiNLP 3.1) tags with
+        # lst20, 1.4 (PyThaiNLP 4.0+) with orchid_ud.
+        fuse_pos_ner = (
+            self.on_pos
+            and self.on_ner
+            and self.pos_engine == "perceptron"
+            and getattr(getattr(self.ner, "engine", None), "pos_tag_name", None)
+            == self.pos_corpus
+        )
+        self._steps = tuple(
+            step for on, step in [
+                (self.dependency_parsing, self._dep),
+                (self.on_tokenize, self._tokenize),
+                (self.on_sent, self._sent),
+                (fuse_pos_ner, self._pos_ner),
+                (self.on_pos and not fuse_pos_ner, self._pos),
+                (self.on_ner and not fuse_pos_ner, self._ner),
+                (self.word_vector and self.word_vector_lazy, self._vec_hooks),
+            ] if on
+        )
+
+    def __call__(self, doc:Doc):
+        for step in self._steps:
+            doc = step(doc)
         return doc
-    
+
+    def pipe(self, stream, batch_size=64):
+        """
+        Process a stream of Doc in minibatches
+
+        Each engine is run over the whole minibatch before moving on to
+        the next one, so its model stays warm across documents. Docs are
+        not spread over threads: newmm and the thainer feature extraction
+        are pure Python and hold the GIL, and the shared CRF tagger is not
+        safe to call from several threads at once.
+        """
+        if self.word_vector and _in_spacy_pipe_worker():
+            warnings.warn(
+                "spacy-pythainlp: word_vector is on in a nlp.pipe(n_process>1) "
+                "worker, every worker process holds its own copy of the word "
+                "vector table. Set word_vector to False or use n_process=1 "
+                "with a larger batch_size.",
+                stacklevel=2,
+            )
+        if not self._steps:
+            # Everything is turned off, don't build minibatches for nothing
+            yield from stream
+            return
+        # Steps that can handle a whole minibatch in one engine call
+        batch_steps = {self._pos: self._pos_batch}
+        for docs in util.minibatch(stream, size=batch_size):
+            for step in self._steps:
+                if step in batch_steps:
+                    docs = batch_steps[step](docs)
+                else:
+                    docs = [step(doc) for doc in docs]
+            yield from docs
+
     def _tokenize(self, doc:Doc):
-        words = list(word_tokenize(doc.text, engine=self.tokenize_engine))
-        spaces = [False for i in words]
+        words = self._word_tokenize(doc.text)
+        # Same words as the Doc already has (spaCy's Thai tokenizer is newmm
+        # too), keep the Doc and whatever is already set on it. Both cover
+        # doc.text without gaps then, so equal lengths mean equal tokens.
+        if (
+            len(words) == len(doc)
+            and not doc.to_array(SPACY).any()
+            and np.array_equal(
+                doc.to_array(LENGTH),
+                np.fromiter(map(len, words), dtype=np.uint64, count=len(words)),
+            )
+        ):
+            return doc
+        # Whitespace stays as its own token, so no token has trailing space.
+        # spaces can't be left out, Doc defaults every token to a trailing
+        # space, but zeroed bytes are one byte per token instead of a list.
+        spaces = bytes(len(words))
         return Doc(self.nlp.vocab, words=words, spaces=spaces)
 
     def _pos(self, doc:Doc):
-        _pos_tag = []
+        # One pos_tag_sents call, every sentence tagged on its own
+        _tagged = self._pos_tag_sents(self._pos_words(doc))
+        return self._set_pos(doc, [tag for sent in _tagged for _, tag in sent])
+
+    def _pos_batch(self, docs):
+        """
+        POS tag the sentences of every Doc with one pos_tag_sents call
+        """
+        _list_txt = [self._pos_words(doc) for doc in docs]
+        _tagged = iter(self._pos_tag_sents([i for sents in _list_txt for i in sents]))
+        for doc, sents in zip(docs, _list_txt):
+            self._set_pos(doc, [tag for _sent in sents for _, tag in next(_tagged)])
+        return docs
+
+    def _pos_words(self, doc:Doc):
         if doc.is_sentenced:
-            _list_txt = [[j.text for j in i] for i in list(doc.sents)]
-        else:
-            _list_txt = [[j.text for j in doc]]
-        for i in _list_txt:
-            _word = i
-            _tag_ = pos_tag(_word, engine=self.pos_engine, corpus=self.pos_corpus)
-            _pos_tag.extend([tag for _,tag in _tag_])
-        for i,_ in enumerate(_pos_tag):
-            doc[i].pos_ = _pos_tag[i]
+            return [[j.text for j in i] for i in doc.sents]
+        return [[j.text for j in doc]]
+
+    def _set_pos(self, doc:Doc, _pos_tag):
+        try:
+            _pos_ids = np.fromiter(
+                map(POS_IDS.__getitem__, _pos_tag), dtype=np.uint64, count=len(_pos_tag)
+            )
+        except KeyError:
+            # Not a Universal POS tag, let spaCy's setter raise its error
+            for i, tag in enumerate(_pos_tag):
+                doc[i].pos_ = tag
+            return doc
+        doc.from_array([POS], _pos_ids.reshape(-1, 1))
         return doc
 
     def _sent(self, doc:Doc):
-        from pythainlp.tokenize import sent_tokenize
-        _text = sent_tokenize(str(doc.text), engine=self.sent_engine)
-        _doc = word_tokenize('SPLIT'.join(_text), engine=self.tokenize_engine)
-        number_skip = 0
-        seen_break = False
-        _new_cut = []
-        for i, word in enumerate(_doc):
-            if 'SPLIT' in word:
-                if word.startswith("SPLIT"):
-                    _new_cut.append("SPLIT")
-                    _new_cut.append(word.replace('SPLIT',''))
-                elif word.endswith("SPLIT"):
-                    _new_cut.append(word.replace('SPLIT',''))
-                    _new_cut.append("SPLIT")
-                else:
-                    _new_cut.append(word)
-            else:
-                _new_cut.append(word)
-        for i, word in enumerate(_new_cut):
-            if i-number_skip == len(doc) -1:
-                break
-            elif i == 0:
-                doc[i-number_skip].is_sent_start = True
-            elif seen_break:
-                doc[i-number_skip].is_sent_start = True
-                seen_break = False
-            elif 'SPLIT' in word:
-                seen_break = True
-                number_skip += 1
-            else:
-                doc[i-number_skip].is_sent_start = False
+        # Doc.text joins every token on each access, so read it once
+        text = doc.text
+        _text = sent_tokenize(text, engine=self.sent_engine)
+        # Character offset of every sentence, found with str.find so that
+        # sentence engines which drop whitespace still line up
+        _char_starts = []
+        _cursor = 0
+        for i in _text:
+            _at = text.find(i, _cursor)
+            if _at >= 0:
+                _char_starts.append(_at)
+                _cursor = _at + len(i)
+        # The token each sentence starts in
+        boundaries = np.searchsorted(
+            doc.to_array(IDX).astype(np.int64), _char_starts, side="right"
+        ) - 1
+        sent_starts = np.full(len(doc), -1, dtype=np.int64)
+        sent_starts[boundaries[boundaries >= 0]] = 1
+        sent_starts[:1] = 1
+        # SENT_START is stored unsigned, -1 (not a start) wraps like in to_array
+        doc.from_array([SENT_START], sent_starts.view(np.uint64).reshape(-1, 1))
         return doc
 
     def _dep(self, doc:Doc):
-        from pythainlp.parse import dependency_parsing
-        text = str(doc.text)
-        words = []
-        spaces = []
-        pos = []
-        tags = []
-        morphs = []
-        deps = []
-        heads = []
-        lemmas = []
-        offset = 0
-        _dep_temp = dependency_parsing(text, model=self.dependency_parsing_model, engine=self.dependency_parsing_engine, tag="list")
-        for i in _dep_temp:
-            idx, word, _, postag, _, _, head, dep, _, space =  i
-            words.append(word)
-            pos.append(postag)
-            heads.append(int(head))
-            deps.append(dep)
-            if space == '_':
-                spaces.append(True)
-            else:
-                spaces.append(False)
+        _dep_temp = dependency_parsing(doc.text, model=self.dependency_parsing_model, engine=self.dependency_parsing_engine, tag="list")
+        n = len(_dep_temp)
+        words = [None] * n
+        pos = [None] * n
+        deps = [None] * n
+        heads = [None] * n
+        spaces = np.empty(n, dtype=bool)
+        try:
+            for i, row in enumerate(_dep_temp):
+                idx, word, _, postag, _, _, head, dep, _, space, *_ = row
+                words[i] = word
+                pos[i] = postag
+                heads[i] = head
+                deps[i] = dep
+                spaces[i] = space == '_'
+        except ValueError as e:
+            raise ValueError(
+                f"Can't read row {i} of the {self.dependency_parsing_engine} "
+                f"dependency parsing output as CoNLL-U: {row!r}"
+            ) from e
+        # numpy parses the whole HEAD column in one go
+        try:
+            heads = np.asarray(heads, dtype=np.int32)
+        except (TypeError, ValueError) as e:
+            # Only look for the bad row once numpy has failed
+            i = next(i for i, head in enumerate(heads) if not _is_int(head))
+            raise ValueError(
+                f"Can't read the HEAD of row {i} of the "
+                f"{self.dependency_parsing_engine} dependency parsing output "
+                f"as an integer: {_dep_temp[i]!r}"
+            ) from e
         return Doc(self.nlp.vocab, words=words, spaces=spaces,pos=pos,deps=deps,heads=heads)
 
 
     def _ner(self, doc:Doc):
-        _list_txt = []
+        return self._set_ents(doc, *self._tag_ner(doc, pos=False))
+
+    def _pos_ner(self, doc:Doc):
+        """
+        POS and NER from a single thainer pass over each sentence
+
+        thainer POS tags the words of each sentence with the same perceptron
+        tagger and corpus as _pos, so when its words are the Doc's tokens
+        the tags are the ones _pos would give.
+        """
+        if not doc.is_sentenced:
+            # NER tags token by token here, which gives no context for POS
+            return self._ner(self._pos(doc))
+        _tagged, _piece_chars, _piece_words = self._tag_ner(doc, pos=True)
+        _pos_tag = [postag for _, postag, _ in _tagged]
+        if (
+            [w for w, _, _ in _tagged] == [j.text for j in doc]
+            and all(tag in POS_IDS for tag in _pos_tag)
+        ):
+            self._set_pos(doc, _pos_tag)
+        else:
+            # thainer split the words differently from the Doc, or its tags
+            # are not Universal POS tags
+            self._pos(doc)
+        return self._set_ents(doc, _tagged, _piece_chars, _piece_words)
+
+    def _tag_ner(self, doc:Doc, pos):
+        """
+        Run NER over each sentence of the Doc, or each token when the Doc
+        has no sentences. The transformer engines can't take more subwords
+        than their model was trained on, so a whole Doc is never tagged at
+        once. Returns the tagged words and where each piece starts.
+        """
         if doc.is_sentenced:
-            _list_txt = [i.text for i in list(doc.sents)]
+            pieces = [(i.start_char, i.text) for i in doc.sents]
         else:
-            _list_txt = [j.text for j in doc]
-        _ner_ =[]
-        for i in _list_txt:
-            _ner_.extend(self.ner.tag(i, pos=False))
-        _new_ner = []
-        c=0
-        _t=""
-        for i,(w, tag) in enumerate(_ner_):
-            len_w = len(w)
-            if i+1 == len(_ner_) and _t != "":
-                _new_ner[-1][1] = c+len_w
-            elif i+1 == len(_ner_) and tag.startswith("B-"):
-                _t =  tag.replace("B-","")
-                _new_ner.append([c,c+len_w,_t])
-            elif tag.startswith("B-") and _t=="":
-                _t = tag.replace("B-","")
-                _new_ner.append([c,None,_t])
-            elif tag.startswith("B-") and _t!="":
-                _new_ner[-1][1] = c
-                _t =  tag.replace("B-","")
-                _new_ner.append([c,None,_t])
-            elif tag == "O" and _t!="":
-                _new_ner[-1][1] = c
-                _t=""
-            c+=len_w
+            pieces = [(i.idx, i.text) for i in doc]
+        _ner_ = []
+        _piece_chars = []
+        _piece_words = []
+        _ner_tag = self.ner.tag
+        for start_char, text in pieces:
+            _tagged = _ner_tag(text, pos=pos)
+            _ner_.extend(_tagged)
+            _piece_chars.append(start_char)
+            _piece_words.append(len(_tagged))
+        return _ner_, _piece_chars, _piece_words
+
+    def _set_ents(self, doc:Doc, _ner_, _piece_chars, _piece_words):
+        """
+        Set doc.ents from NER output, the word comes first and the BIO tag
+        last in each item, so (word, tag) and (word, pos, tag) both work.
+        _piece_words[k] words were tagged from the text at character
+        _piece_chars[k] of the Doc.
+        """
+        # B (I)* is the BIO state machine, so scan for it with a compiled
+        # pattern over the one-letter tag kinds instead of a Python loop.
+        _kinds = "".join([i[-1][0] for i in _ner_])
+        # (first tag, end tag) index pairs of every entity, in one flat buffer
+        _found_at = np.fromiter(
+            chain.from_iterable(map(re.Match.span, _ENTITY_PATTERN.finditer(_kinds))),
+            dtype=np.int64,
+        ).reshape(-1, 2)
         _ents = []
-        for start, end, label in _new_ner:
-            span = doc.char_span(start, end, label=label, alignment_mode="contract")
-            if span is None:
-                pass
-            else:
-                _ents.append(span)
-
-        doc.ents = _ents
+        if len(_found_at):
+            _lengths = np.fromiter(
+                map(len, map(itemgetter(0), _ner_)), dtype=np.int64, count=len(_ner_)
+            )
+            # starts[i] is where the i-th tagged word would be if all pieces
+            # were one text, starts[-1] is the end of that text
+            starts = np.zeros(len(_ner_) + 1, dtype=np.int64)
+            np.cumsum(_lengths, out=starts[1:])
+            # Move the words of every piece to where the piece is in the Doc,
+            # the whitespace between sentences is not part of any piece
+            _counts = np.asarray(_piece_words, dtype=np.int64)
+            _piece_first = np.cumsum(_counts) - _counts
+            _word_starts = starts[:-1] + np.repeat(
+                np.asarray(_piece_chars, dtype=np.int64) - starts[_piece_first],
+                _counts,
+            )
+            _word_ends = _word_starts + _lengths
+            _labels = [_ner_label(_ner_[i][-1]) for i in _found_at[:, 0].tolist()]
+            _bounds = doc.to_array([IDX, LENGTH]).astype("int64")
+            _tok_starts = _bounds[:, 0]
+            _tok_ends = _tok_starts + _bounds[:, 1]
+            # Same as char_span(..., alignment_mode="contract"), an entity
+            # keeps the tokens that lie completely inside it
+            _first = np.searchsorted(
+                _tok_starts, _word_starts[_found_at[:, 0]], side="left"
+            )
+            _last = np.searchsorted(
+                _tok_ends, _word_ends[_found_at[:, 1] - 1], side="right"
+            )
+            _ents = [
+                Span(doc, start, end, label=label)
+                for start, end, label in zip(_first.tolist(), _last.tolist(), _labels)
+                if start < end
+            ]
+        doc.set_ents(_ents)
         return doc
 
-    def _vec(self):
-        from pythainlp.word_vector import WordVector
-        _wv = WordVector(model_name=self.word_vector_model)
-        self.nlp.vocab.reset_vectors(width=_wv.model["แมว"].shape[0])
-        _temp = list(dict(_wv.model.key_to_index).keys())
-        for i in _temp:
-            self.nlp.vocab[i].vector = _wv.model[i]
+    def _vec_hooks(self, doc:Doc):
+        """
+        Make the vectors of the Doc load the word vectors on first use
+        """
+        _vectors = self._vectors
+        doc.user_hooks["vector"] = _vectors.mean_vector
+        doc.user_hooks["has_vector"] = _vectors.any_has_vector
+        doc.user_hooks["similarity"] = _vectors.similarity
+        doc.user_span_hooks["vector"] = _vectors.mean_vector
+        doc.user_span_hooks["has_vector"] = _vectors.any_has_vector
+        doc.user_span_hooks["similarity"] = _vectors.similarity
+        doc.user_token_hooks["vector"] = _vectors.token_vector
+        doc.user_token_hooks["has_vector"] = _vectors.token_has_vector
+        doc.user_token_hooks["similarity"] = _vectors.similarity
+        return doc
 
     def to_bytes(self, **kwargs):
         return b""